@@ -1,9 +1,15 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
+import duckdb
 from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
 from datetime import date, timedelta
 import os
+import io
+import json
 from urllib.parse import quote_plus
+from st_aggrid import AgGrid, ColumnsAutoSizeMode, GridOptionsBuilder, GridUpdateMode, JsCode
 
 # LOAD ENV / SECRETS
 DB_HOST = st.secrets.get("DB_HOST", os.getenv("DB_HOST"))
@@ -12,6 +18,11 @@ DB_NAME = st.secrets.get("DB_NAME", os.getenv("DB_NAME"))
 DB_USER = st.secrets.get("DB_USER", os.getenv("DB_USER"))
 DB_PASSWORD = st.secrets.get("DB_PASSWORD", os.getenv("DB_PASSWORD"))
 
+# OPSIONAL: DB_HOST / DB_PORT MENGARAH KE PGBOUNCER
+DB_USE_PGBOUNCER = str(
+    st.secrets.get("DB_USE_PGBOUNCER", os.getenv("DB_USE_PGBOUNCER", ""))
+).lower() in ("1", "true", "yes")
+
 # VALIDASI ENV
 missing = [k for k, v in {
     "DB_HOST": DB_HOST,
@@ -28,10 +39,23 @@ if missing:
 DB_PASSWORD = quote_plus(DB_PASSWORD)
 
 # DB ENGINE
-engine = create_engine(
-    f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{int(DB_PORT)}/{DB_NAME}",
-    pool_pre_ping=True
-)
+@st.cache_resource
+def get_engine():
+    url = f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{int(DB_PORT)}/{DB_NAME}"
+
+    # PGBOUNCER (TRANSACTION MODE) SUDAH MENGELOLA POOL;
+    # statement_timeout diatur di PgBouncer / role DB karena startup parameter "options" ditolak
+    if DB_USE_PGBOUNCER:
+        return create_engine(url, poolclass=NullPool)
+
+    return create_engine(
+        url,
+        pool_size=10,
+        max_overflow=5,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        connect_args={"options": "-c statement_timeout=30000"}
+    )
 
 # PAGE CONFIG
 st.set_page_config(
@@ -52,23 +76,31 @@ selected_date = st.sidebar.date_input(
 )
 
 start_date = end_date = selected_date
-cache_buster = selected_date.strftime("%Y-%m-%d")
 
 
 # LOAD FILTER OPTIONS
 @st.cache_data
 def load_filter_options():
     query = """
-        SELECT DISTINCT outlet, item
+        SELECT
+            outlet,
+            array_agg(DISTINCT item ORDER BY item) AS items
         FROM public.mv_movement_daily
         WHERE item NOT ILIKE '%frozen%'
-        ORDER BY outlet, item
+          AND outlet IS NOT NULL
+          AND item IS NOT NULL
+        GROUP BY outlet
+        ORDER BY outlet
     """
-    return pd.read_sql(text(query), engine)
+    engine = get_engine()
+    filter_df = pd.read_sql(text(query), engine)
+
+    # OUTLET -> DAFTAR ITEM, DIBANGUN SEKALI SAAT CACHE DIISI
+    return dict(zip(filter_df["outlet"], filter_df["items"]))
 
-filter_df = load_filter_options()
+items_by_outlet = load_filter_options()
 
-outlet_options = filter_df["outlet"].dropna().unique().tolist()
+outlet_options = list(items_by_outlet)
 
 default_index = (
     outlet_options.index("Alfamart Kopo")
@@ -82,14 +114,16 @@ outlet_selected = st.sidebar.selectbox(
     index=default_index
 )
 
+item_options = items_by_outlet.get(outlet_selected, [])
+
 item_selected = st.sidebar.multiselect(
     "Item",
-    options=filter_df["item"].dropna().unique()
+    options=item_options
 )
 
-# LOAD DATA
-@st.cache_data
-def load_data(start_date, end_date, outlet_selected, item_selected, cache_buster):
+# DUCKDB SNAPSHOT PER PERIODE (DIPAKAI SEMUA USER, MAKS 8 PERIODE DI MEMORI)
+@st.cache_resource(ttl=900, max_entries=8)
+def load_snapshot(start_date, end_date):
     query = """
         SELECT
             tanggal,
@@ -108,7 +142,7 @@ def load_data(start_date, end_date, outlet_selected, item_selected, cache_buster
             so_flag
         FROM public.mv_movement_daily
         WHERE tanggal BETWEEN :start_date AND :end_date
-          AND lower(item) NOT ILIKE '%frozen%'
+          AND item NOT ILIKE '%frozen%'
     """
 
     params = {
@@ -116,34 +150,112 @@ def load_data(start_date, end_date, outlet_selected, item_selected, cache_buster
         "end_date": end_date
     }
 
+    # SKEMA EKSPLISIT: PERIODE KOSONG TETAP PUNYA TIPE KOLOM YANG BENAR
+    con = duckdb.connect(":memory:")
+    con.execute("""
+        CREATE TABLE md (
+            tanggal DATE,
+            outlet VARCHAR,
+            spv VARCHAR,
+            kota VARCHAR,
+            item VARCHAR,
+            stock_awal DOUBLE,
+            stock_masuk DOUBLE,
+            qty_terpakai DOUBLE,
+            qty_sisa DOUBLE,
+            ideal_usage_qty DOUBLE,
+            retur_qty DOUBLE,
+            qty_sisa_seharusnya DOUBLE,
+            gap_qty_sisa DOUBLE,
+            so_flag VARCHAR
+        )
+    """)
+
+    # STREAMING (SERVER-SIDE CURSOR), DIMASUKKAN KE DUCKDB PER CHUNK
+    engine = get_engine()
+    with engine.connect().execution_options(stream_results=True, yield_per=10_000) as conn:
+        result = conn.execute(text(query), params)
+        columns = list(result.keys())
+
+        for partition in result.partitions():
+            chunk_df = pd.DataFrame.from_records(partition, columns=columns, coerce_float=True)
+            con.register("chunk_df", chunk_df)
+            con.execute("INSERT INTO md SELECT * FROM chunk_df")
+            con.unregister("chunk_df")
+
+    return con
+
+# FILTER SQL
+def build_where(outlet_selected, item_selected):
+    where = " WHERE TRUE"
+    params = []
+
     if outlet_selected:
-        query += " AND outlet = :outlet"
-        params["outlet"] = outlet_selected
+        where += " AND outlet = ?"
+        params.append(outlet_selected)
 
     if item_selected:
-        query += " AND item = ANY(:item)"
-        params["item"] = item_selected
+        where += " AND list_contains(?, item)"
+        params.append(list(item_selected))
 
-    query += " ORDER BY tanggal, outlet, item"
+    return where, params
 
-    return pd.read_sql(text(query), engine, params=params)
+# LOAD COUNTS
+def load_counts(start_date, end_date, outlet_selected, item_selected):
+    where, params = build_where(outlet_selected, item_selected)
 
-df = load_data(start_date, end_date, outlet_selected, item_selected, cache_buster)
+    query = """
+        SELECT
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE so_flag = 'Tidak Sesuai') AS tidak_sesuai
+        FROM md
+    """ + where
+
+    with load_snapshot(start_date, end_date).cursor() as cur:
+        total, tidak_sesuai = cur.execute(query, params).fetchone()
+
+    return total, tidak_sesuai
+
+# LOAD DATA
+def load_data(start_date, end_date, outlet_selected, item_selected):
+    where, params = build_where(outlet_selected, item_selected)
+
+    query = "SELECT * FROM md" + where
+    query += " ORDER BY tanggal, outlet, item"
+
+    with load_snapshot(start_date, end_date).cursor() as cur:
+        return cur.execute(query, params).df()
 
 # INFO PERIODE
 st.caption(f"📅 Periode Data: {start_date}")
 
-if df.empty:
-    st.warning("⚠️ Tidak ada data untuk filter yang dipilih")
+summary = st.container()
+
+st.divider()
+
+# DETAIL DATA (HANYA DIMUAT JIKA DIMINTA)
+show_detail = st.toggle("Tampilkan Detail Data")
+
+query_args = (start_date, end_date, outlet_selected, item_selected)
+
+if show_detail:
+    df = load_data(*query_args)
+    total = len(df)
+    tidak_sesuai = int((df["so_flag"] == "Tidak Sesuai").sum())
+else:
+    total, tidak_sesuai = load_counts(*query_args)
+
+if total == 0:
+    summary.warning("⚠️ Tidak ada data untuk filter yang dipilih")
     st.stop()
 
-tidak_sesuai = (df["so_flag"] == "Tidak Sesuai").sum()
-st.warning(f"❗ Jumlah Data **Tidak Sesuai**: **{tidak_sesuai}**")
+summary.warning(f"❗ Jumlah Data **Tidak Sesuai**: **{tidak_sesuai}**")
 
-st.divider()
+if not show_detail:
+    st.stop()
 
 # RENAME KOLOM
-df = df.rename(columns={
+rename_map = {
     "tanggal": "Tanggal",
     "outlet": "Outlet",
     "spv": "SPV",
@@ -158,7 +270,9 @@ df = df.rename(columns={
     "qty_sisa_seharusnya": "Sisa Seharusnya",
     "gap_qty_sisa": "Selisih Sisa",
     "so_flag": "Status Stok"
-})
+}
+
+df.rename(columns=rename_map, inplace=True)
 
 # BULATKAN KOLOM NUMERIK
 numeric_cols = [
@@ -172,14 +286,11 @@ numeric_cols = [
     "Selisih Sisa"
 ]
 
-for col in numeric_cols:
-    if col in df.columns:
-        df[col] = (
-            df[col]
-            .fillna(0)
-            .round(0)
-            .astype("int64")
-        )
+df[numeric_cols] = (
+    np.nan_to_num(df[numeric_cols].to_numpy(dtype="float64"), nan=0.0)
+    .round()
+    .astype(np.int32)
+)
 
 # HIGHLIGHT TIDAK SESUAI
 highlight_cols = [
@@ -191,20 +302,50 @@ highlight_cols = [
     "Status Stok"
 ]
 
-def highlight_tidak_sesuai(row):
-    return [
-        "background-color: #ffcccc; font-weight: bold;"
-        if row["Status Stok"] == "Tidak Sesuai" and col in highlight_cols
-        else ""
-        for col in row.index
-    ]
-
-styled_df = df.style.apply(highlight_tidak_sesuai, axis=1)
+highlight_cell_style = JsCode(f"""
+function(params) {{
+    if (params.data["Status Stok"] === "Tidak Sesuai"
+        && {json.dumps(highlight_cols)}.includes(params.colDef.field)) {{
+        return {{backgroundColor: "#ffcccc", fontWeight: "bold"}};
+    }}
+    return null;
+}}
+""")
 
 # TABLE
-st.dataframe(
-    styled_df,
-    use_container_width=True,
+def display_dataframe_quickly(df, max_rows=5000, height=600):
+    n_rows = len(df)
+
+    if n_rows > max_rows:
+        start_row = st.slider(
+            "Mulai dari baris",
+            min_value=0,
+            max_value=n_rows - max_rows,
+            value=0
+        )
+        st.caption(
+            f"Menampilkan baris {start_row + 1} - {start_row + max_rows} dari {n_rows}"
+        )
+        df = df.iloc[start_row:start_row + max_rows]
+
+    # TANGGAL TANPA JAM (JSON GRID MEMAKAI FORMAT ISO LENGKAP)
+    df = df.assign(Tanggal=df["Tanggal"].dt.strftime("%Y-%m-%d"))
+
+    gb = GridOptionsBuilder.from_dataframe(df)
+    gb.configure_default_column(cellStyle=highlight_cell_style)
+
+    AgGrid(
+        df,
+        gridOptions=gb.build(),
+        height=height,
+        allow_unsafe_jscode=True,
+        update_mode=GridUpdateMode.NO_UPDATE,
+        columns_auto_size_mode=ColumnsAutoSizeMode.FIT_ALL_COLUMNS_TO_VIEW
+    )
+
+display_dataframe_quickly(
+    df,
+    max_rows=5000,
     height=600
 )
 
@@ -226,9 +367,15 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # DOWNLOAD
+@st.cache_data(ttl=300, max_entries=64)
+def to_csv_bytes(df):
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False)
+    return buf.getvalue()
+
 st.download_button(
     label="⬇️ Download CSV",
-    data=df.to_csv(index=False),
+    data=to_csv_bytes(df),
     file_name="movement_daily.csv",
     mime="text/csv"
 )
@@ -0,0 +1,33 @@
+-- COVERING INDEX UNTUK QUERY SNAPSHOT (app.py: load_snapshot)
+-- Filter: tanggal BETWEEN + item NOT ILIKE '%frozen%', tanpa ORDER BY
+-- (filter outlet / item dan pengurutan dijalankan di DuckDB, bukan di Postgres).
+-- Range scan pada kolom depan tanggal; filter item dievaluasi dari index.
+-- Semua kolom yang di-SELECT ada di INCLUDE -> Index Only Scan, tanpa akses heap.
+-- Jalankan di luar transaction block (CONCURRENTLY).
+CREATE INDEX CONCURRENTLY IF NOT EXISTS mv_md_cover
+    ON public.mv_movement_daily (tanggal, outlet, item)
+    INCLUDE (
+        spv,
+        kota,
+        stock_awal,
+        stock_masuk,
+        qty_terpakai,
+        qty_sisa,
+        ideal_usage_qty,
+        retur_qty,
+        qty_sisa_seharusnya,
+        gap_qty_sisa,
+        so_flag
+    );
+
+-- Index Only Scan butuh visibility map yang up to date:
+-- jalankan juga setelah setiap REFRESH MATERIALIZED VIEW.
+VACUUM ANALYZE public.mv_movement_daily;
+
+-- VERIFIKASI: plan harus menunjukkan "Index Only Scan using mv_md_cover"
+-- EXPLAIN (ANALYZE, BUFFERS)
+-- SELECT tanggal, outlet, spv, kota, item, stock_awal, stock_masuk, qty_terpakai,
+--        qty_sisa, ideal_usage_qty, retur_qty, qty_sisa_seharusnya, gap_qty_sisa, so_flag
+-- FROM public.mv_movement_daily
+-- WHERE tanggal BETWEEN '2026-10-12' AND '2026-10-12'
+--   AND item NOT ILIKE '%frozen%';